@@ -38,6 +38,9 @@ Here are some tips to help with that:
 * Most importantly, when running the server in debug mode, consider setting
   `dev_tools_props_check=False`.
 * Also consider creating the `Dash` application with `update_title=None`.
+* Install `orjson` for 2-5x faster serialization of the stores that hold the
+  (base64 encoded) slice data. Dash picks it up automatically when available.
+* Similarly, install `pybase64` for faster base64 encoding of the slice data.
 * Setting `reverse_y` to False negatively affects performance. This will be
   fixed in a future version of Plotly/Dash.
 * For a smooth experience, avoid triggering unnecessary figure updates.
@@ -79,6 +82,8 @@ Here are some tips to help with that:
 # now this seems by far the easiest solution :)
 
 
+import json
+
 import numpy as np
 import plotly.graph_objects
 import dash
@@ -88,9 +93,13 @@ from dash.dcc import Graph, Slider, Store, Interval
 from .utils import (
     discrete_colors,
     img_array_to_uri,
+    img_array_to_thumbnail,
+    map_in_threads,
+    img_array_to_raw,
     get_thumbnail_size,
     shape3d_to_size2d,
     mask_to_coloured_slices,
+    colormap_to_palette,
 )
 
 
@@ -104,7 +113,13 @@ class VolumeSlicer:
     * `app` (`dash.Dash`): the Dash application instance.
     * `volume` (`ndarray`): the 3D numpy array to slice through. The dimensions
       are assumed to be in zyx order. If this is not the case, you can
-      use `np.swapaxes` to make it so.
+      use `np.swapaxes` to make it so. For large datasets, a `np.memmap` is
+      supported (and preferred), so that only the slices that are shown are
+      read from disk. Set `clim` to avoid a full scan of the data at startup.
+      Note that for `axis=2`, an in-memory volume is copied (with the slicing
+      axis first), because slicing it directly is slow. This copy takes as
+      much memory as the volume, and is a snapshot: later in-place changes
+      to the volume are not shown. Use a memmap to avoid the copy.
     * `spacing` (tuple of `float`): the distance between voxels for each
       dimension (zyx). The spacing and origin are applied to make the slice
       drawn in "scene space" rather than "voxel space".
@@ -125,6 +140,11 @@ class VolumeSlicer:
     * `thumbnail` (`int` or `bool`): the preferred size of low-resolution data
       to be uploaded to the client. If `False`, the full-resolution data are
       uploaded client-side. If `True` (default), a default value of 32 is used.
+    * `raw_pixels` (`bool`): whether to send the full-resolution slices as raw
+      pixel data, which the browser turns into an image. This avoids encoding
+      PNG images on the server, at the cost of more data over the wire, which
+      is usually a good trade-off on localhost or LAN. Only applies when
+      thumbnails are used. Default False.
 
     Note that this is not a Dash Component. The components that make
     up the slicer (and which must be present in the layout) are:
@@ -146,6 +166,7 @@ class VolumeSlicer:
         scene_id=None,
         color=None,
         thumbnail=True,
+        raw_pixels=False,
     ):
 
         if not isinstance(app, dash.Dash):
@@ -167,6 +188,14 @@ class VolumeSlicer:
         self._axis = int(axis)
         self._reverse_y = bool(reverse_y)
 
+        # Get a view with the slicing axis first. Slicing along the last axis
+        # reads memory with a large stride, so for in-memory volumes we make a
+        # copy in which each slice is contiguous. Memmaps are left alone.
+        if self._axis == 2 and not isinstance(volume, np.memmap):
+            self._slices = np.ascontiguousarray(np.moveaxis(volume, 2, 0))
+        else:
+            self._slices = np.moveaxis(volume, self._axis, 0)
+
         # Check and store contrast limits
         if clim is None:
             self._initial_clim = self._volume.min(), self._volume.max()
@@ -190,6 +219,7 @@ class VolumeSlicer:
                 self._thumbnail_param = None  # consider 0 and -1 the same as False
             else:
                 self._thumbnail_param = thumbnail
+        self._raw_pixels = bool(raw_pixels)
 
         # Check and store scene id, and generate
         if scene_id is None:
@@ -217,7 +247,7 @@ class VolumeSlicer:
             "offset": shape3d_to_size2d(origin, axis),
             "stepsize": shape3d_to_size2d(spacing, axis),
             "color": color,
-            "infoid": np.random.randint(1, 9999999),
+            "infoid": int(np.random.randint(1, 9999999)),
         }
 
         # Also store thumbnail size. The get_thumbnail_size() is a bit like
@@ -229,6 +259,25 @@ class VolumeSlicer:
                 self._slice_info["size"][:2], self._thumbnail_param
             )
 
+        # Precompute the geometry that the client uses on each state update.
+        # The bbox is the extent of the slice in scene coordinates. The
+        # indicator_size is the length of the (own color) corner indicators,
+        # which is the same (in scene coordinates) for all slicers of the
+        # same data.
+        size = self._slice_info["size"]
+        offset = self._slice_info["offset"]
+        stepsize = self._slice_info["stepsize"]
+        self._slice_info["bbox"] = [
+            offset[0] - 0.5 * stepsize[0],
+            offset[0] + (size[0] - 0.5) * stepsize[0],
+            offset[1] - 0.5 * stepsize[1],
+            offset[1] + (size[1] - 0.5) * stepsize[1],
+        ]
+        lengths = [size[i] * stepsize[i] for i in range(3)]
+        indicator_size = 0.1 * sum(lengths) / 3  # average
+        indicator_size = min(indicator_size, 0.45 * min(lengths))  # failsafe
+        self._slice_info["indicator_size"] = indicator_size
+
         # Build the slicer
         self._create_dash_components()
         self._create_server_callbacks()
@@ -323,7 +372,8 @@ class VolumeSlicer:
         """Given a 3D mask array, create an object that can be used as
         output for `slicer.overlay_data`. Set mask to `None` to clear the mask.
         The color can be a hex color or an rgb/rgba tuple. Alternatively,
-        color can be a list of such colors, defining a colormap.
+        color can be a list of such colors (or an Nx3 or Nx4 array),
+        defining a colormap.
         """
         if mask is None:
             return [None for index in range(self.nslices)]  # A reset
@@ -331,7 +381,8 @@ class VolumeSlicer:
             raise ValueError(
                 f"Overlay must has shape {mask.shape}, but expected {self._volume.shape}"
             )
-        return mask_to_coloured_slices(mask, self._axis, color)
+        palette = colormap_to_palette(color)
+        return mask_to_coloured_slices(mask, self._axis, palette=palette)
 
     def _subid(self, name, use_dict=False, **kwargs):
         """Given a name, get the full id including the context id prefix."""
@@ -350,17 +401,29 @@ class VolumeSlicer:
             assert not kwargs
             return self._context_id + "-" + name
 
-    def _slice(self, index, clim):
-        """Sample a slice from the volume."""
+    def _slice(self, index, clim, ref_size=None):
+        """Sample a slice from the volume. If ref_size is given, the slice
+        is downscaled to the thumbnail size.
+        """
         # Sample from the volume
-        indices = [slice(None), slice(None), slice(None)]
-        indices[self._axis] = index
-        im = self._volume[tuple(indices)].astype(np.float32)
-        # Apply contrast limits
+        im = self._slices[index]
         clim = min(clim), max(clim)
-        im = (im - clim[0]) * (255 / (clim[1] - clim[0]))
-        im[im < 0] = 0
-        im[im > 255] = 255
+        # Downscale before applying the clim, so we process less pixels
+        if ref_size:
+            im = img_array_to_thumbnail(im, ref_size)
+        # For uint8 data, avoid processing the full slice as float
+        if im.dtype == np.uint8:
+            if clim == (0, 255):
+                return im
+            lut = self._apply_clim(np.arange(256, dtype=np.float32), clim)
+            return lut[im]
+        return self._apply_clim(im.astype(np.float32), clim)
+
+    def _apply_clim(self, im, clim):
+        """Apply contrast limits to a float32 array (in-place), producing uint8."""
+        im -= clim[0]
+        im *= 255 / (clim[1] - clim[0])
+        np.clip(im, 0, 255, out=im)
         return im.astype(np.uint8)
 
     def _create_dash_components(self):
@@ -412,9 +475,6 @@ class VolumeSlicer:
 
         # Create the stores that we need (these must be present in the layout)
 
-        # A dict of static info for this slicer
-        self._info = Store(id=self._subid("info"), data=info)
-
         # A tuple representing the contrast limits
         self._clim = Store(id=self._subid("clim"), data=self._initial_clim)
 
@@ -429,12 +489,6 @@ class VolumeSlicer:
             id=self._subid("server-data"), data={"index": -1, "slice": None}
         )
 
-        # Store image traces to show in the figure
-        self._img_traces = Store(id=self._subid("img-traces"), data=[])
-
-        # Store indicator traces to show in the figure
-        self._indicator_traces = Store(id=self._subid("indicator-traces"), data=[])
-
         # Store more (user-defined) traces to show in the figure
         self._extra_traces = Store(id=self._subid("extra-traces"), data=[])
 
@@ -448,13 +502,10 @@ class VolumeSlicer:
         self._setpos = Store(id=self._subid("setpos", True), data=None)
 
         self._stores = [
-            self._info,
             self._clim,
             self._thumbs_data,
             self._overlay_data,
             self._server_data,
-            self._img_traces,
-            self._indicator_traces,
             self._extra_traces,
             self._timer,
             self._state,
@@ -470,10 +521,10 @@ class VolumeSlicer:
             [Input(self._clim.id, "data")],
         )
         def upload_thumbnails(clim):
-            return [
-                img_array_to_uri(self._slice(i, clim), self._thumbnail_param)
-                for i in range(self.nslices)
-            ]
+            return map_in_threads(
+                lambda i: img_array_to_uri(self._slice(i, clim, self._thumbnail_param)),
+                range(self.nslices),
+            )
 
         if self._thumbnail_param is not None:
             # The callback to push full-res slices to the client is only needed
@@ -487,7 +538,12 @@ class VolumeSlicer:
                 if state is None or not state["index_changed"]:
                     return dash.no_update
                 index = state["index"]
-                slice = img_array_to_uri(self._slice(index, clim))
+                im = self._slice(index, clim)
+                if self._raw_pixels:
+                    h, w = im.shape
+                    raw = img_array_to_raw(im)
+                    return {"index": index, "bytes": raw, "w": w, "h": h}
+                slice = img_array_to_uri(im)
                 return {"index": index, "slice": slice}
 
     def _create_client_callbacks(self):
@@ -499,27 +555,29 @@ class VolumeSlicer:
         #         \                         \
         #          \                   server_data (a new slice)
         #           \                         \
-        #            \                         -->  image_traces
-        #             ------------------------/          \
-        #                                                 \
-        #        state (external)  -->  indicator_traces -- ----->  figure
-        #                                                 /
-        #                                         extra_traces
+        #            ------------------------------->  figure
+        #                                             /    \
+        #                              state (external)    extra_traces
         #
         # This figure is incomplete, for the sake of keeping it
-        # relatively simple. E.g. the thumbnail data is also an input
-        # for the callback that generates the image traces. And the
+        # relatively simple. E.g. the thumbnail data and overlay data are
+        # also inputs for the callback that produces the figure. And the
         # clim store is an input for the callbacks that produce
         # server_data and thumbnail data.
 
         app = self._app
 
+        # The slice info is static, so we inline it in the JS code, rather
+        # than passing it as State to the callbacks on each invocation.
+        info_json = json.dumps(self._slice_info)
+
         # ----------------------------------------------------------------------
         # Callback to trigger fellow slicers to go to a specific position on click.
 
         app.clientside_callback(
             """
-        function update_setpos_from_click(data, index, info) {
+        function update_setpos_from_click(data, index) {
+            const info = {{INFO}};
             if (data && data.points && data.points.length) {
                 let point = data["points"][0];
                 let xyz = [point["x"], point["y"]];
@@ -529,10 +587,12 @@ class VolumeSlicer:
             }
             return dash_clientside.no_update;
         }
-        """,
+        """.replace(
+                "{{INFO}}", info_json
+            ),
             Output(self._setpos.id, "data"),
             [Input(self._graph.id, "clickData")],
-            [State(self._slider.id, "value"), State(self._info.id, "data")],
+            [State(self._slider.id, "value")],
         )
 
         # ----------------------------------------------------------------------
@@ -540,7 +600,8 @@ class VolumeSlicer:
 
         app.clientside_callback(
             """
-        function update_slider_value(positions, cur_index, info) {
+        function update_slider_value(positions, cur_index) {
+            const info = {{INFO}};
             for (let trigger of dash_clientside.callback_context.triggered) {
                 if (!trigger.value) continue;
                 let pos = trigger.value[2 - info.axis];
@@ -551,7 +612,9 @@ class VolumeSlicer:
             }
             return dash_clientside.no_update;
         }
-        """,
+        """.replace(
+                "{{INFO}}", info_json
+            ),
             Output(self._slider.id, "value"),
             [
                 Input(
@@ -563,7 +626,7 @@ class VolumeSlicer:
                     "data",
                 )
             ],
-            [State(self._slider.id, "value"), State(self._info.id, "data")],
+            [State(self._slider.id, "value")],
         )
 
         # ----------------------------------------------------------------------
@@ -629,7 +692,9 @@ class VolumeSlicer:
 
         app.clientside_callback(
             """
-        function update_state(n_intervals, index, info, figure) {
+        function update_state(n_intervals, index, figure) {
+
+            const info = {{INFO}};
 
             if (!window._slicer_{{ID}}) window._slicer_{{ID}} = {};
             let private_state = window._slicer_{{ID}};
@@ -647,15 +712,9 @@ class VolumeSlicer:
             // Disable the timer
             private_state.timeout = 0;
 
-            // Calculate view range based on the volume
-            let xrangeVol = [
-                info.offset[0] - 0.5 * info.stepsize[0],
-                info.offset[0] + (info.size[0] - 0.5) * info.stepsize[0]
-            ];
-            let yrangeVol = [
-                info.offset[1] - 0.5 * info.stepsize[1],
-                info.offset[1] + (info.size[1] - 0.5) * info.stepsize[1]
-            ];
+            // View range based on the volume
+            let xrangeVol = [info.bbox[0], info.bbox[1]];
+            let yrangeVol = [info.bbox[2], info.bbox[3]];
 
             // Get view range from the figure. We make range[0] < range[1]
             let xrangeFig = figure.layout.xaxis.range
@@ -697,6 +756,8 @@ class VolumeSlicer:
         }
         """.replace(
                 "{{ID}}", self._context_id
+            ).replace(
+                "{{INFO}}", info_json
             ),
             Output(self._state.id, "data"),
             [
@@ -704,20 +765,37 @@ class VolumeSlicer:
             ],
             [
                 State(self._slider.id, "value"),
-                State(self._info.id, "data"),
                 State(self._graph.id, "figure"),
             ],
             prevent_initial_call=True,
         )
 
         # ----------------------------------------------------------------------
-        # Callback that creates a list of image traces (slice and overlay).
+        # Callback that composes the figure from the image traces (slice and
+        # overlay), the indicator traces, and the extra traces. These are
+        # combined in a single callback to avoid intermediate stores and the
+        # extra round-trips through the Dash dispatcher that these imply.
 
         app.clientside_callback(
             """
-        function update_image_traces(index, server_data, overlays, thumbnails, info, current_traces) {
+        function update_figure(index, server_data, overlays, thumbnails, states, extra_traces, thisState, ori_figure) {
+
+            const info = {{INFO}};
+
+            if (!window._slicer_{{ID}}) window._slicer_{{ID}} = {};
+            let private_state = window._slicer_{{ID}};
+
+            // Get whether the states or extra traces were changed. If not, one
+            // of the inputs for the image traces was changed (or initial call).
+            let states_changed = false;
+            let extra_traces_changed = false;
+            for (let trigger of dash_clientside.callback_context.triggered) {
+                if (trigger.prop_id.indexOf('"state"') >= 0) states_changed = true;
+                if (trigger.prop_id.indexOf('extra-traces') >= 0) extra_traces_changed = true;
+            }
+
+            // -- Image traces
 
-            // Prepare traces
             let slice_trace = {
                 type: 'image',
                 x0: info.offset[0],
@@ -730,10 +808,30 @@ class VolumeSlicer:
             overlay_trace.hoverinfo = 'skip';
             overlay_trace.source = overlays[index] || '';
             overlay_trace.hovertemplate = '';
-            let new_traces = [slice_trace, overlay_trace];
+            let img_traces = [slice_trace, overlay_trace];
 
             // Use full data, or use thumbnails
-            if (index == server_data.index) {
+            if (index == server_data.index && server_data.bytes) {
+                // Raw pixel data, turn it into an image (once per slice)
+                if (server_data.bytes !== private_state.raw_bytes) {
+                    let bin = atob(server_data.bytes);
+                    let canvas = document.createElement('canvas');
+                    canvas.width = server_data.w;
+                    canvas.height = server_data.h;
+                    let ctx = canvas.getContext('2d');
+                    let imdata = ctx.createImageData(server_data.w, server_data.h);
+                    let pixels = imdata.data;
+                    for (let i = 0; i < bin.length; i++) {
+                        let v = bin.charCodeAt(i);
+                        pixels[4 * i] = pixels[4 * i + 1] = pixels[4 * i + 2] = v;
+                        pixels[4 * i + 3] = 255;
+                    }
+                    ctx.putImageData(imdata, 0, 0);
+                    private_state.raw_bytes = server_data.bytes;
+                    private_state.raw_source = canvas.toDataURL('image/png');
+                }
+                slice_trace.source = private_state.raw_source;
+            } else if (index == server_data.index) {
                 slice_trace.source = server_data.slice;
             } else {
                 slice_trace.source = thumbnails[index];
@@ -746,133 +844,116 @@ class VolumeSlicer:
                 slice_trace.y0 += 0.5 * slice_trace.dy - 0.5 * info.stepsize[1];
             }
 
-            // Has the image data even changed?
-            if (!current_traces.length) { current_traces = [{source:''}, {source:''}]; }
-            if (new_traces[0].source == current_traces[0].source &&
-                new_traces[1].source == current_traces[1].source)
+            // Has the image data even changed? The private state outlives the
+            // graph, so on an initial call (e.g. when the graph is re-mounted)
+            // or when the figure is empty, the traces are always sent.
+            let img_traces_changed = true;
+            let last_img_traces = private_state.img_traces;
+            let is_initial_call = !dash_clientside.callback_context.triggered.some(
+                trigger => trigger.prop_id && trigger.prop_id != '.'
+            );
+            let figure_has_data = ori_figure && ori_figure.data && ori_figure.data.length > 0;
+            if (last_img_traces && !is_initial_call && figure_has_data &&
+                img_traces[0].source == last_img_traces[0].source &&
+                img_traces[1].source == last_img_traces[1].source)
             {
-                new_traces = dash_clientside.no_update;
+                img_traces_changed = false;
+                img_traces = last_img_traces;
             }
-            return new_traces;
-        }
-        """.replace(
-                "{{ID}}", self._context_id
-            ),
-            Output(self._img_traces.id, "data"),
-            [
-                Input(self._slider.id, "value"),
-                Input(self._server_data.id, "data"),
-                Input(self._overlay_data.id, "data"),
-                Input(self._thumbs_data.id, "data"),
-            ],
-            [
-                State(self._info.id, "data"),
-                State(self._img_traces.id, "data"),
-            ],
-        )
-
-        # ----------------------------------------------------------------------
-        # Callback to create scatter traces from the positions of other slicers.
-
-        app.clientside_callback(
-            """
-        function update_indicator_traces(states, info, thisState) {
-            let traces = [];
-
-            for (let state of states) {
-                if (!state) continue;
-                let zpos = [state.zpos, state.zpos];
-                let trace = null;
-                if        (info.axis == 0 && state.axis == 1) {
-                    trace = {x: state.xrange, y: zpos};
-                } else if (info.axis == 0 && state.axis == 2) {
-                    trace = {x: zpos, y: state.xrange};
-                } else if (info.axis == 1 && state.axis == 2) {
-                    trace = {x: zpos, y: state.yrange};
-                } else if (info.axis == 1 && state.axis == 0) {
-                    trace = {x: state.xrange, y: zpos};
-                } else if (info.axis == 2 && state.axis == 0) {
-                    trace = {x: state.yrange, y: zpos};
-                } else if (info.axis == 2 && state.axis == 1) {
-                    trace = {x: zpos, y: state.yrange};
-                }
-                if (trace) {
-                    trace.line = {color: state.color, width: 1};
-                    traces.push(trace);
+            private_state.img_traces = img_traces;
+
+            // -- Indicator traces (from the positions of other slicers)
+
+            let indicator_traces = private_state.indicator_traces || [];
+            if (states_changed && thisState) {
+                indicator_traces = [];
+
+                for (let state of states) {
+                    if (!state) continue;
+                    let zpos = [state.zpos, state.zpos];
+                    let trace = null;
+                    if        (info.axis == 0 && state.axis == 1) {
+                        trace = {x: state.xrange, y: zpos};
+                    } else if (info.axis == 0 && state.axis == 2) {
+                        trace = {x: zpos, y: state.xrange};
+                    } else if (info.axis == 1 && state.axis == 2) {
+                        trace = {x: zpos, y: state.yrange};
+                    } else if (info.axis == 1 && state.axis == 0) {
+                        trace = {x: state.xrange, y: zpos};
+                    } else if (info.axis == 2 && state.axis == 0) {
+                        trace = {x: state.yrange, y: zpos};
+                    } else if (info.axis == 2 && state.axis == 1) {
+                        trace = {x: zpos, y: state.yrange};
+                    }
+                    if (trace) {
+                        trace.line = {color: state.color, width: 1};
+                        indicator_traces.push(trace);
+                    }
                 }
-            }
 
-            // Show our own color around the image, but only if there are other
-            // slicers with the same scene id, on a different axis. We do some
-            // math to make sure that these indicators are the same size (in
-            // scene coordinates) for all slicers of the same data.
-            if (thisState && info.color && traces.length) {
-                let fraction = 0.1;
-                let lengthx = info.size[0] * info.stepsize[0];
-                let lengthy = info.size[1] * info.stepsize[1];
-                let lengthz = info.size[2] * info.stepsize[2];
-                let dd = fraction * (lengthx + lengthy + lengthz) / 3;  // average
-                dd = Math.min(dd, 0.45 * Math.min(lengthx, lengthy, lengthz));  // failsafe
-                let x1 = thisState.xrange[0];
-                let x2 = thisState.xrange[0] + dd;
-                let x3 = thisState.xrange[1] - dd;
-                let x4 = thisState.xrange[1];
-                let y1 = thisState.yrange[0];
-                let y2 = thisState.yrange[0] + dd;
-                let y3 = thisState.yrange[1] - dd;
-                let y4 = thisState.yrange[1];
-                traces.push({
-                    x: [x1, x1, x2, null, x3, x4, x4, null, x4, x4, x3, null, x2, x1, x1],
-                    y: [y2, y1, y1, null, y1, y1, y2, null, y3, y4, y4, null, y4, y4, y3],
-                    line: {color: info.color, width: 4}
-                });
-            }
+                // Show our own color around the image, but only if there are other
+                // slicers with the same scene id, on a different axis.
+                if (info.color && indicator_traces.length) {
+                    let dd = info.indicator_size;
+                    let x1 = thisState.xrange[0];
+                    let x2 = thisState.xrange[0] + dd;
+                    let x3 = thisState.xrange[1] - dd;
+                    let x4 = thisState.xrange[1];
+                    let y1 = thisState.yrange[0];
+                    let y2 = thisState.yrange[0] + dd;
+                    let y3 = thisState.yrange[1] - dd;
+                    let y4 = thisState.yrange[1];
+                    indicator_traces.push({
+                        x: [x1, x1, x2, null, x3, x4, x4, null, x4, x4, x3, null, x2, x1, x1],
+                        y: [y2, y1, y1, null, y1, y1, y2, null, y3, y4, y4, null, y4, y4, y3],
+                        line: {color: info.color, width: 4}
+                    });
+                }
 
-            // Post-process the traces we created above
-            for (let trace of traces) {
-                trace.type = 'scatter';
-                trace.mode = 'lines';
-                trace.hoverinfo = 'skip';
-                trace.showlegend = false;
-            }
-            if (thisState) {
-                return traces;
-            } else {
+                // Post-process the traces we created above
+                for (let trace of indicator_traces) {
+                    trace.type = 'scatter';
+                    trace.mode = 'lines';
+                    trace.hoverinfo = 'skip';
+                    trace.showlegend = false;
+                }
+                private_state.indicator_traces = indicator_traces;
+            } else if (!img_traces_changed && !extra_traces_changed) {
                 return dash_clientside.no_update;
             }
-        }
-        """,
-            Output(self._indicator_traces.id, "data"),
-            [Input({"scene": self._scene_id, "context": ALL, "name": "state"}, "data")],
-            [
-                State(self._info.id, "data"),
-                State(self._state.id, "data"),
-            ],
-            prevent_initial_call=True,
-        )
 
-        # ----------------------------------------------------------------------
-        # Callback that composes a figure from multiple trace sources.
+            // -- Compose the figure
 
-        app.clientside_callback(
-            """
-        function update_figure(img_traces, indicator_traces, extra_traces, info, ori_figure) {
-            // Collect traces
             let traces = [];
             for (let trace of img_traces) { traces.push(trace); }
             for (let trace of extra_traces) { traces.push(trace); }
             for (let trace of indicator_traces) { if (trace.line.color) traces.push(trace); }
-            // Update figure
+            // Only send the new data if this version of Dash supports partial updates
+            if (dash_clientside.Patch) {
+                return new dash_clientside.Patch().assign(['data'], traces).build();
+            }
             let figure = {...ori_figure};
             figure.data = traces;
             return figure;
         }
-        """,
+        """.replace(
+                "{{ID}}", self._context_id
+            ).replace(
+                "{{INFO}}", info_json
+            ),
             Output(self._graph.id, "figure"),
             [
-                Input(self._img_traces.id, "data"),
-                Input(self._indicator_traces.id, "data"),
+                Input(self._slider.id, "value"),
+                Input(self._server_data.id, "data"),
+                Input(self._overlay_data.id, "data"),
+                Input(self._thumbs_data.id, "data"),
+                Input(
+                    {"scene": self._scene_id, "context": ALL, "name": "state"}, "data"
+                ),
                 Input(self._extra_traces.id, "data"),
             ],
-            [State(self._info.id, "data"), State(self._graph.id, "figure")],
+            [
+                State(self._state.id, "data"),
+                State(self._graph.id, "figure"),
+            ],
         )
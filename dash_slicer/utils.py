@@ -4,17 +4,70 @@ the code in slicer.py smaller, and makes it easier to test.
 """
 
 import io
-import base64
+import os
+import math
+import zlib
+import struct
+import hashlib
+import functools
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 import plotly
 import numpy as np
 import PIL.Image
 
+try:
+    from pybase64 import b64encode_as_string  # SIMD-accelerated, when available
+except ImportError:
+    from binascii import b2a_base64
+
+    def b64encode_as_string(s):
+        return b2a_base64(s, newline=False).decode()
+
 
 # The default colors to use for indicators and overlays
 discrete_colors = plotly.colors.qualitative.D3
 
 
+class _UriCache:
+    """A thread-safe LRU cache for data URIs, limited by their total size,
+    so that it can hold many small (overlay) images or fewer large ones.
+    """
+
+    def __init__(self, maxsize):
+        self._maxsize = maxsize
+        self._size = 0
+        self._uris = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            uri = self._uris.get(key)
+            if uri is not None:
+                self._uris.move_to_end(key)
+            return uri
+
+    def set(self, key, uri):
+        with self._lock:
+            if key in self._uris:
+                return
+            self._uris[key] = uri
+            self._size += len(uri)
+            while self._size > self._maxsize:
+                self._size -= len(self._uris.popitem(last=False)[1])
+
+    def clear(self):
+        with self._lock:
+            self._uris.clear()
+            self._size = 0
+
+
+# Cache for img_array_to_uri(), mapping image fingerprints to data URIs
+_uri_cache = _UriCache(64 * 2**20)
+
+
 def _thumbnail_size_from_scalar(image_size, ref_size):
     if image_size[0] > image_size[1]:
         return int(ref_size * image_size[0] / image_size[1]), ref_size
@@ -22,42 +75,223 @@ def _thumbnail_size_from_scalar(image_size, ref_size):
         return ref_size, int(ref_size * image_size[1] / image_size[0])
 
 
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool():
+    # The pool is created on first use, and shared, so that we don't spin
+    # up (and tear down) threads on each call, e.g. in every callback.
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(
+                max_workers=os.cpu_count(), thread_name_prefix="dash_slicer"
+            )
+        return _pool
+
+
+def map_in_threads(func, items):
+    """Apply func to each item, using a thread pool if there are multiple
+    cores. This is effective for image encoding, because Pillow and zlib
+    release the GIL while compressing.
+    """
+    items = list(items)
+    n_workers = min(os.cpu_count() or 1, len(items))
+    # Run serially when called from the pool itself, to avoid a deadlock
+    in_pool = threading.current_thread().name.startswith("dash_slicer")
+    if n_workers <= 1 or in_pool:
+        return [func(item) for item in items]
+    return list(_get_pool().map(func, items))
+
+
 def img_as_ubyte(img):
-    """Quick-n-dirty conversion function.
-    We'll have explicit contrast limits eventually.
+    """Convert an image to uint8. Uint8 images are returned as-is. Other
+    images are stretched between their 2nd and 98th percentile (or their
+    min and max if these coincide), so that a few outliers (e.g. hot
+    pixels) don't make the rest dark.
     """
     if img.dtype == np.uint8:
         return img
     else:
-        img = img.astype(np.float32)
-        mi, ma = img.min(), img.max()
-        img = (img - mi) * (255 / (ma - mi)) + 0.5
-        return img.astype(np.uint8)
+        if img.dtype == bool:
+            img = img.view(np.uint8)  # percentiles need numbers
+        # Estimate the percentiles from a subsample, which is much cheaper,
+        # and precise enough for display. Fall back to min and max if the
+        # percentiles coincide, e.g. for images that are mostly background.
+        step = max(1, int((img.size / 2**14) ** 0.5))
+        mi, ma = np.percentile(img[::step, ::step], [2, 98])
+        if not ma > mi:
+            mi, ma = img.min(), img.max()
+        if not ma > mi:
+            return np.zeros(img.shape, np.uint8)  # constant (or nan) image
+        # Do the stretch in-place, in a single float32 copy
+        out = np.subtract(img, mi, dtype=np.float32)
+        out *= np.float32(255 / (np.float32(ma) - np.float32(mi)))
+        out += 0.5
+        np.clip(out, 0, 255, out=out)
+        return out.astype(np.uint8)
+
 
+def img_array_to_uri(
+    img_array, ref_size=None, fmt="png", palette=None, compress_level=1
+):
+    """Convert the given image (numpy array) into a base64-encoded PNG.
+    Set fmt to "jpeg" to produce a (lossy) JPEG instead, which is faster
+    to encode and smaller, but does not support transparency. If a palette
+    (a 256x4 uint8 rgba array) is given, the image (uint8) is encoded as
+    an indexed PNG, which is about 4x smaller than rgba. The PNG zlib
+    compress_level (0-9) defaults to 1, which is much faster than higher
+    levels, and barely larger.
+    """
+    if fmt not in ("png", "jpeg"):
+        raise ValueError(f"Image format must be 'png' or 'jpeg', not {fmt!r}.")
+    if compress_level not in range(10):
+        raise ValueError(f"PNG compress_level must be 0-9, not {compress_level!r}.")
+    # The same slice is often requested repeatedly (e.g. when scrubbing the
+    # slider, or when only some overlay slices change). Hashing is cheap
+    # compared to encoding, so we cache the results by content.
+    img_array = np.ascontiguousarray(img_array)
+    digest = hashlib.blake2b(img_array.data, digest_size=16).digest()
+    key = digest, img_array.shape, img_array.dtype.str, ref_size, fmt, compress_level
+    if palette is not None:
+        palette = np.asarray(palette, np.uint8)
+        key += (palette.tobytes(),)
+    uri = _uri_cache.get(key)
+    if uri is None:
+        uri = _img_array_to_uri(img_array, ref_size, fmt, palette, compress_level)
+        _uri_cache.set(key, uri)
+    return uri
 
-def img_array_to_uri(img_array, ref_size=None):
-    """Convert the given image (numpy array) into a base64-encoded PNG."""
+
+def _img_array_to_uri(img_array, ref_size, fmt, palette, compress_level):
+    if ref_size:
+        img_array = img_array_to_thumbnail(img_array, ref_size)
     img_array = img_as_ubyte(img_array)
+    if palette is not None and (img_array.ndim != 2 or fmt != "png"):
+        raise ValueError("A palette is only supported for grayscale PNG.")
+    if fmt == "jpeg":
+        img_pil = PIL.Image.fromarray(img_array)
+        if img_pil.mode not in ("L", "RGB"):
+            raise ValueError("JPEG only supports grayscale and RGB images.")
+        f = io.BytesIO()
+        img_pil.save(f, format="JPEG", quality=85)
+        data = f.getbuffer()  # getbuffer() avoids a copy
+    else:
+        data = _encode_png(img_array, palette, compress_level)
+    return f"data:image/{fmt};base64," + b64encode_as_string(data)
+
+
+def _png_chunk(chunk_type, data):
+    crc = zlib.crc32(data, zlib.crc32(chunk_type))  # avoid concatenating data
+    return b"".join(
+        [struct.pack(">I", len(data)), chunk_type, data, struct.pack(">I", crc)]
+    )
+
+
+@functools.lru_cache(maxsize=64)
+def _png_header(width, height, color_type):
+    ihdr = struct.pack(">IIBBBBB", width, height, 8, color_type, 0, 0, 0)
+    return b"\x89PNG\r\n\x1a\n" + _png_chunk(b"IHDR", ihdr)
+
+
+@functools.lru_cache(maxsize=16)
+def _png_palette_chunks(palette_bytes):
+    palette = np.frombuffer(palette_bytes, np.uint8).reshape(-1, 4)
+    plte = _png_chunk(b"PLTE", palette[:, :3].tobytes())
+    trns = _png_chunk(b"tRNS", palette[:, 3].tobytes())
+    return plte + trns
+
+
+def _encode_png(img_array, palette=None, compress_level=1):
+    """Encode a uint8 image (gray, gray-alpha, rgb or rgba) as PNG. With a
+    palette, the image values are palette indices. Writing the PNG with
+    numpy and zlib is about twice as fast as via Pillow, because we can pick
+    a cheap filter that suits our images, and encode at a low compression
+    level by default, which is much faster for a small size increase.
+    """
+    height, width = img_array.shape[:2]
+    nchannels = 1 if img_array.ndim == 2 else img_array.shape[2]
+    rows = img_array.reshape(height, width * nchannels)
+
+    # Each scanline is prefixed with a byte that specifies its filter
+    raw = np.empty((height, 1 + rows.shape[1]), np.uint8)
+    if palette is None:
+        # The "sub" filter stores the difference with the previous pixel,
+        # which makes (smooth) images compress much better.
+        color_type = {1: 0, 2: 4, 3: 2, 4: 6}[nchannels]
+        raw[:, 0] = 1
+        n, filtered = nchannels, raw[:, 1:]
+        filtered[:, :n] = rows[:, :n]
+        np.subtract(rows[:, n:], rows[:, :-n], out=filtered[:, n:])
+        chunks = []
+    else:
+        # Differences between palette indices are meaningless
+        color_type = 3
+        raw[:, 0] = 0
+        raw[:, 1:] = rows
+        # Only write the palette entries that are used, because a full
+        # palette adds about 1 KB, which is a lot for a small overlay.
+        palette = np.asarray(palette, np.uint8)[: int(rows.max()) + 1]
+        chunks = [_png_palette_chunks(palette.tobytes())]
+
+    idat = _png_chunk(b"IDAT", zlib.compress(raw.data, compress_level))
+    header = _png_header(width, height, color_type)
+    return b"".join([header, *chunks, idat, _png_chunk(b"IEND", b"")])
+
+
+def img_array_to_thumbnail(img_array, ref_size):
+    """Downscale the given image (numpy array) to its thumbnail size. Non-uint8
+    grayscale images are resized as float32, so that they can be normalized
+    after downscaling, which is much cheaper.
+    """
+    size = img_array.shape[1], img_array.shape[0]
+    new_size = get_thumbnail_size(size, ref_size)
+    if new_size == size:
+        return img_array
+    if img_array.dtype != np.uint8 and img_array.ndim == 2:
+        img_array = img_array.astype(np.float32, copy=False)
+    else:
+        img_array = img_as_ubyte(img_array)
     img_pil = PIL.Image.fromarray(img_array)
-    if ref_size:
-        size = img_array.shape[1], img_array.shape[0]
-        img_pil.thumbnail(_thumbnail_size_from_scalar(size, ref_size))
-    f = io.BytesIO()
-    img_pil.save(f, format="PNG")
-    base64_str = base64.b64encode(f.getvalue()).decode()
-    return "data:image/png;base64," + base64_str
+    img_pil = img_pil.resize(new_size, PIL.Image.BICUBIC, reducing_gap=2.0)
+    return np.asarray(img_pil)
+
+
+def img_array_to_raw(img_array):
+    """Convert the given image (numpy array) into base64-encoded raw pixel
+    data (uint8, C-order). This avoids the cost of PNG encoding.
+    """
+    img_array = img_as_ubyte(img_array)
+    return b64encode_as_string(np.ascontiguousarray(img_array).data)
 
 
 def get_thumbnail_size(size, ref_size):
     """Given an image size (w, h), and a preferred smaller size,
-    get the actual size if we let Pillow downscale it.
+    get the size of the downscaled image. This follows the logic of
+    Pillow's thumbnail(), without creating an image.
     """
+    return _get_thumbnail_size(tuple(int(x) for x in size), int(ref_size))
+
+
+@functools.lru_cache(maxsize=64)
+def _get_thumbnail_size(size, ref_size):
     # Note that if you call thumbnail() to get the resulting size, then call
     # thumbnail() again with that size, the result may be yet another size.
-    img_array = np.zeros(list(reversed(size)), np.uint8)
-    img_pil = PIL.Image.fromarray(img_array)
-    img_pil.thumbnail(_thumbnail_size_from_scalar(size, ref_size))
-    return img_pil.size
+    width, height = size
+    x, y = _thumbnail_size_from_scalar(size, ref_size)
+    if x >= width and y >= height:
+        return size
+    aspect = width / height
+
+    def round_aspect(number, key):
+        return max(min(math.floor(number), math.ceil(number), key=key), 1)
+
+    if x / y >= aspect:
+        x = round_aspect(y * aspect, key=lambda n: abs(aspect - n / y))
+    else:
+        y = round_aspect(x / aspect, key=lambda n: 0 if n == 0 else abs(aspect - x / n))
+    return x, y
 
 
 def shape3d_to_size2d(shape, axis):
@@ -71,71 +305,117 @@ def shape3d_to_size2d(shape, axis):
     return tuple(size)
 
 
-def mask_to_coloured_slices(mask, axis, color=None):
-    """Turn a mask into a list of base64 encoded coloured slices.
-    Set mask to `None` to clear the mask. The color can be a hex color
-    or an rgb/rgba tuple. Alternatively, color can be a list of such
-    colors, defining a colormap.
+def colormap_to_palette(color=None):
+    """Turn the given color(s) into a palette: a 256x4 uint8 array that
+    maps mask values to rgba colors. The color can be a hex color or an
+    rgb/rgba tuple. Alternatively, color can be a list of such colors
+    (or an Nx3 or Nx4 array), defining a colormap. The result is cached,
+    and should not be modified.
     """
+    return _colormap_to_palette(_as_hashable(color))
 
-    # Check the mask
-    if not isinstance(mask, np.ndarray):
-        raise TypeError("Mask must be an ndarray or None.")
-    elif mask.dtype not in (bool, np.uint8):
-        raise ValueError(f"Mask must have bool or uint8 dtype, not {mask.dtype}.")
 
-    mask = mask.astype(np.uint8, copy=False)  # need int to index
-    nslices = mask.shape[axis]
+def _as_hashable(ob):
+    if isinstance(ob, np.ndarray):
+        ob = ob.tolist()
+    if isinstance(ob, (list, tuple)):
+        return tuple(_as_hashable(x) for x in ob)
+    return ob
+
+
+def _parse_color(c):
+    """Turn a hex color (#rgb, #rgba, #rrggbb or #rrggbbaa) or an rgb/rgba
+    sequence into an rgba tuple. The alpha defaults to 100.
+    """
+    if isinstance(c, str):
+        if not c.startswith("#"):
+            raise ValueError("Named colors are not (yet) supported, hex colors are.")
+        digits = c[1:]
+        if len(digits) in (3, 4):
+            digits = "".join(x + x for x in digits)  # short form
+        try:
+            rgba = tuple(bytes.fromhex(digits))  # already ints
+        except ValueError:
+            rgba = ()
+        if len(rgba) not in (3, 4):
+            raise ValueError(f"Invalid hex color {c!r}.")
+        c = rgba
+    else:
+        c = tuple(int(x) for x in c)
+    if len(c) == 3:
+        c = c + (100,)
+    elif len(c) != 4:
+        raise ValueError("Expected color tuples to be 3 or 4 elements.")
+    return c
+
+
+@functools.lru_cache(maxsize=32)
+def _colormap_to_palette(color):
 
     # Create a colormap (list) from the given color(s)
     if color is None:
         colormap = discrete_colors[3:]
     elif isinstance(color, str):
         colormap = [color]
-    elif isinstance(color, (tuple, list)) and all(
-        isinstance(x, (int, float)) for x in color
-    ):
+    elif isinstance(color, tuple) and all(isinstance(x, (int, float)) for x in color):
         colormap = [color]
     else:
         colormap = list(color)
 
     # Normalize the colormap so each element is a 4-element tuple
-    for i in range(len(colormap)):
-        c = colormap[i]
-        if isinstance(c, str):
-            if c.startswith("#"):
-                c = plotly.colors.hex_to_rgb(c)
-            else:
-                raise ValueError(
-                    "Named colors are not (yet) supported, hex colors are."
-                )
-        c = tuple(int(x) for x in c)
-        if len(c) == 3:
-            c = c + (100,)
-        elif len(c) != 4:
-            raise ValueError("Expected color tuples to be 3 or 4 elements.")
-        colormap[i] = c
+    colormap = [_parse_color(c) for c in colormap]
 
     # Insert zero stub color for where mask is zero
     colormap.insert(0, (0, 0, 0, 0))
 
-    # Produce slices (base64 png strings)
-    overlay_slices = []
-    for index in range(nslices):
-        # Sample the slice
-        indices = [slice(None), slice(None), slice(None)]
-        indices[axis] = index
-        im = mask[tuple(indices)]
-        max_mask = im.max()
-        if max_mask == 0:
-            # If the mask is all zeros, we can simply not draw it
-            overlay_slices.append(None)
-        else:
-            # Turn into rgba
-            while len(colormap) <= max_mask:
-                colormap.append(colormap[-1])
-            colormap_arr = np.array(colormap)
-            rgba = colormap_arr[im]
-            overlay_slices.append(img_array_to_uri(rgba))
+    # Turn the colormap into a palette for all possible mask values,
+    # using the last color for values beyond the colormap.
+    n = min(len(colormap), 256)
+    palette = np.zeros((256, 4), np.uint8)
+    palette[:n] = colormap[:n]
+    palette[n:] = colormap[n - 1]
+    palette.flags.writeable = False
+    return palette
+
+
+def mask_to_coloured_slices(mask, axis, color=None, palette=None):
+    """Turn a mask into a list of base64 encoded coloured slices.
+    Set mask to `None` to clear the mask. The color can be a hex color
+    or an rgb/rgba tuple. Alternatively, color can be a list of such
+    colors, defining a colormap. A prebuilt palette (as returned by
+    `colormap_to_palette()`) can be given instead of color.
+    """
+
+    # Check the mask
+    if not isinstance(mask, np.ndarray):
+        raise TypeError("Mask must be an ndarray or None.")
+    elif mask.dtype not in (bool, np.uint8):
+        raise ValueError(f"Mask must have bool or uint8 dtype, not {mask.dtype}.")
+
+    mask = mask.astype(np.uint8, copy=False)  # need int to index
+    nslices = mask.shape[axis]
+
+    if palette is None:
+        palette = colormap_to_palette(color)
+
+    # Fast path for an empty mask, e.g. when a threshold is out of range
+    if not mask.any():
+        return [None] * nslices
+
+    # By putting the slicing axis first (in a contiguous copy), the mask
+    # slices are contiguous in memory, avoiding strided reads.
+    mask_slices = np.ascontiguousarray(np.moveaxis(mask, axis, 0))
+
+    # Produce slices (base64 png strings). If the mask is all zeros,
+    # we can simply not draw it. Detect such slices in a single pass.
+    # The mask values are used directly as indices into the palette.
+    overlay_slices = [None] * nslices
+    nonempty = mask_slices.any(axis=(1, 2))
+    indices = np.flatnonzero(nonempty).tolist()
+    uris = map_in_threads(
+        lambda i: img_array_to_uri(mask_slices[i], palette=palette), indices
+    )
+    for index, uri in zip(indices, uris):
+        overlay_slices[index] = uri
 
     return overlay_slices
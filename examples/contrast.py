@@ -13,10 +13,9 @@ import imageio
 app = dash.Dash(__name__, update_title=None)
 
 vol = imageio.volread("imageio:stent.npz")
+mi, ma = int(vol.min()), int(vol.max())  # scan the volume only once
 slicer = VolumeSlicer(app, vol, clim=(0, 1000))
-clim_slider = dcc.RangeSlider(
-    id="clim-slider", min=vol.min(), max=vol.max(), value=(0, 1000)
-)
+clim_slider = dcc.RangeSlider(id="clim-slider", min=mi, max=ma, value=(0, 1000))
 
 app.layout = html.Div([slicer.graph, slicer.slider, clim_slider, *slicer.stores])
 
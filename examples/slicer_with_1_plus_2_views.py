@@ -16,6 +16,7 @@ Note how the indicators represent the actual position in "scene coordinates".
 import dash
 from dash import html
 from dash_slicer import VolumeSlicer
+import numpy as np
 import imageio
 
 
@@ -23,7 +24,7 @@ app = dash.Dash(__name__, update_title=None)
 
 vol1 = imageio.volread("imageio:stent.npz")
 
-vol2 = vol1[::3, ::2, :]
+vol2 = np.ascontiguousarray(vol1[::3, ::2, :])  # not a strided view
 spacing = 3, 2, 1
 ori = 1000, 2000, 3000
 
@@ -78,9 +78,12 @@ app.layout = html.Div(
 app.clientside_callback(
     """
 function update_3d_figure(states, ori_figure) {
-    let traces = [ori_figure.data[0]]
+    let traces = [];
     for (let state of states) {
-        if (!state) continue;
+        if (!state) {
+            traces.push({type: 'scatter3d', visible: false});  // placeholder
+            continue;
+        }
         let xrange = state.xrange;
         let yrange = state.yrange;
         let xyz = [
@@ -98,8 +101,15 @@ function update_3d_figure(states, ori_figure) {
         };
         traces.push(s);
     }
+    // Only replace the line traces, leaving the (big) mesh untouched,
+    // if this version of Dash supports partial updates.
+    if (dash_clientside.Patch) {
+        let patch = new dash_clientside.Patch();
+        traces.forEach((trace, i) => patch.assign(['data', i + 1], trace));
+        return patch.build();
+    }
     let figure = {...ori_figure};
-    figure.data = traces;
+    figure.data = [ori_figure.data[0], ...traces];
     return figure;
 }
     """,
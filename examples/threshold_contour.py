@@ -5,12 +5,14 @@ This shows a volume with contours overlaid on top. The `extra_traces`
 property is used to add scatter traces that represent the contours.
 """
 
+import functools
 import plotly
 import dash
 from dash import html
 from dash import dcc
 from dash.dependencies import Input, Output
 from dash_slicer import VolumeSlicer
+import numpy as np
 import imageio
 from skimage import measure
 
@@ -19,7 +21,7 @@ app = dash.Dash(__name__, update_title=None)
 server = app.server
 
 vol = imageio.volread("imageio:stent.npz")
-mi, ma = vol.min(), vol.max()
+mi, ma = int(vol.min()), int(vol.max())  # scan the volume only once
 slicer = VolumeSlicer(app, vol, clim=(0, 800))
 
 
@@ -39,29 +41,58 @@ app.layout = html.Div(
 )
 
 
+# The style of the contour traces, each a different color
+trace_templates = [
+    {"type": "scatter", "mode": "lines", "line": {"color": color, "width": 3}}
+    for color in plotly.colors.qualitative.D3
+]
+
+
+@functools.lru_cache(maxsize=64)
+def get_contours(index, level):
+    """Get the contours for the given slice and level. These are cached,
+    so that they're not recomputed when only the view changes.
+    """
+    contours = []
+    for contour in measure.find_contours(vol[index], level):
+        # Reduce the payload: a tenth of a pixel is precise enough, and
+        # after rounding, consecutive duplicate points can be dropped.
+        contour = np.round(contour, 1)
+        keep = np.ones(len(contour), bool)
+        keep[1:] = np.any(contour[1:] != contour[:-1], axis=1)
+        contours.append(contour[keep])
+    return contours
+
+
+def clip_to_view(contour, xrange, yrange):
+    """Get the parts of the contour that are in view."""
+    y, x = contour[:, 0], contour[:, 1]
+    inside = (x >= xrange[0]) & (x <= xrange[1]) & (y >= yrange[0]) & (y <= yrange[1])
+    # Also keep the neighbouring points, so that lines run up to the edge
+    near = inside.copy()
+    near[1:] |= inside[:-1]
+    near[:-1] |= inside[1:]
+    # Split into runs of points that are near the view
+    splits = np.flatnonzero(near[1:] != near[:-1]) + 1
+    starts = np.concatenate([[0], splits])
+    return [part for part, keep in zip(np.split(contour, splits), near[starts]) if keep]
+
+
 @app.callback(
     Output(slicer.extra_traces.id, "data"),
     [Input("level-slider", "value"), Input(slicer.state.id, "data")],
 )
 def apply_levels(level, state):
-    if not state:
+    if not state or level is None:
         return dash.no_update
-    slice = vol[state["index"]]
-    contours = measure.find_contours(slice, level)
-    # Create a trace for each contour, each a different color
+    contours = get_contours(state["index"], level)
+    # Create traces for the visible parts of each contour, each contour
+    # in a different color.
     traces = []
     for i, contour in enumerate(contours):
-        colors = plotly.colors.qualitative.D3
-        color = colors[i % len(colors)]
-        traces.append(
-            {
-                "type": "scatter",
-                "mode": "lines",
-                "line": {"color": color, "width": 3},
-                "x": contour[:, 1],
-                "y": contour[:, 0],
-            }
-        )
+        template = trace_templates[i % len(trace_templates)]
+        for part in clip_to_view(contour, state["xrange"], state["yrange"]):
+            traces.append({**template, "x": part[:, 1], "y": part[:, 0]})
     return traces
 
 
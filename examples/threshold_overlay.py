@@ -6,6 +6,8 @@ possible values (0, 1, 2), and is created by applying two thresholds
 to the image data.
 """
 
+import functools
+import threading
 import dash
 from dash import html
 from dash import dcc
@@ -19,7 +21,7 @@ app = dash.Dash(__name__, update_title=None)
 server = app.server
 
 vol = imageio.volread("imageio:stent.npz")
-mi, ma = vol.min(), vol.max()
+mi, ma = int(vol.min()), int(vol.max())  # scan the volume only once
 slicer = VolumeSlicer(app, vol, clim=(0, 800))
 
 
@@ -29,8 +31,8 @@ app.layout = html.Div(
         slicer.slider,
         dcc.RangeSlider(
             id="level-slider",
-            min=vol.min(),
-            max=vol.max(),
+            min=mi,
+            max=ma,
             step=1,
             value=[mi + 0.1 * (ma - mi), mi + 0.3 * (ma - mi)],
         ),
@@ -42,16 +44,34 @@ app.layout = html.Div(
 # Define colormap to make the lower threshold shown in yellow, and higher in red
 colormap = [(255, 255, 0, 50), (255, 0, 0, 100)]
 
+# Buffers to compute the mask in, so we don't allocate volumes on each
+# update. Callbacks may run concurrently, so access is guarded by a lock.
+mask = np.empty(vol.shape, np.uint8)
+above = np.empty(vol.shape, bool)
+mask_lock = threading.Lock()
+
 
 @app.callback(
     Output(slicer.overlay_data.id, "data"),
     [Input("level-slider", "value")],
 )
 def apply_levels(level):
-    mask = np.zeros(vol.shape, np.uint8)
-    mask += vol > level[0]
-    mask += vol > level[1]
-    return slicer.create_overlay_data(mask, colormap)
+    if not level:
+        return dash.no_update
+    return get_overlay_data(*level)
+
+
+@functools.lru_cache(maxsize=1)
+def get_overlay_data(level0, level1):
+    """Get the overlay data for the given levels. The last result is
+    cached, so repeated (or restored) levels are not recomputed.
+    """
+    # Count the thresholds that each voxel exceeds
+    with mask_lock:
+        np.greater(vol, level0, out=mask.view(bool))
+        np.greater(vol, level1, out=above)
+        np.add(mask, above.view(np.uint8), out=mask)
+        return slicer.create_overlay_data(mask, colormap)
 
 
 if __name__ == "__main__":
@@ -2,13 +2,17 @@
 A test application to test the performance of a few methods to display an image.
 """
 
+import base64
+
+import flask
 import plotly.graph_objects as go
 import dash
 from dash import html
 from dash import dcc
 from dash.dependencies import Input, Output, State
+import numpy as np
 import imageio
-from dash_slicer.utils import img_array_to_uri
+from dash_slicer.utils import img_array_to_uri, map_in_threads
 
 
 app = dash.Dash(__name__, update_title=None)
@@ -17,9 +21,36 @@ server = app.server
 # Read volumes and create slicer objects
 vol = imageio.volread("imageio:stent.npz")
 
-slices_png = [img_array_to_uri(im) for im in vol]
+slices_png = map_in_threads(img_array_to_uri, vol)  # zlib releases the GIL
+slices_jpeg = map_in_threads(lambda im: img_array_to_uri(im, fmt="jpeg"), vol)
+image_bytes = {
+    fmt: [base64.b64decode(uri.split(",", 1)[1]) for uri in uris]
+    for fmt, uris in [("png", slices_png), ("jpeg", slices_jpeg)]
+}
+
+
+# Serve the slices by url, so that they're not all sent to the browser up-front,
+# and the browser can cache them.
+@server.route("/slice/<int:index>.<fmt>")
+def serve_slice(index, fmt):
+    if fmt not in image_bytes:
+        flask.abort(404)
+    response = flask.Response(image_bytes[fmt][index], mimetype=f"image/{fmt}")
+    response.cache_control.max_age = 3600
+    return response
+
 
-OPTIONS = ["noop", "empty", "heatmap", "heatmapgl", "png", "png not reversed"]
+# Serve the volume as raw int16 data, which is much smaller than JSON,
+# and can be indexed as a typed array by the client.
+vol_bytes = np.ascontiguousarray(vol, "<i2").tobytes()
+
+
+@server.route("/vol.bin")
+def serve_volume():
+    return flask.Response(vol_bytes, mimetype="application/octet-stream")
+
+
+OPTIONS = ["noop", "empty", "heatmap", "heatmapgl", "png", "png not reversed", "jpeg"]
 
 ##
 
@@ -54,10 +85,10 @@ app.layout = html.Div(
         html.Div(id="fps"),
         html.Br(),
         dcc.Graph(id="graph", figure=fig),
-        dcc.Interval(id="interval", interval=1),
+        dcc.Interval(id="interval", interval=16),  # about 60 FPS
         dcc.Store(id="index", data=0),
-        dcc.Store(id="data_list", data=vol),
-        dcc.Store(id="data_png", data=slices_png),
+        dcc.Store(id="vol_shape", data=vol.shape),
+        dcc.Store(id="vol_loaded", data=False),
     ]
 )
 
@@ -82,7 +113,21 @@ function update_index(_, index) {
 
 app.clientside_callback(
     """
-function update_figure(index, option, ori_figure, data_list, data_png) {
+function load_volume(shape) {
+    return fetch('/vol.bin').then(r => r.arrayBuffer()).then(buffer => {
+        window._vol = new Int16Array(buffer);
+        return true;
+    });
+}
+""",
+    Output("vol_loaded", "data"),
+    [Input("vol_shape", "data")],
+)
+
+
+app.clientside_callback(
+    """
+function update_figure(index, option, ori_figure, shape) {
 
     // Get FPS
     let fps_result = dash_clientside.no_update;
@@ -97,37 +142,51 @@ function update_figure(index, option, ori_figure, data_list, data_png) {
         window.framecount += 1;
     }
 
+    // Only send the changes if this version of Dash supports partial updates
+    function make_figure(data, yrange) {
+        if (dash_clientside.Patch) {
+            let patch = new dash_clientside.Patch();
+            patch.assign(['data'], data).assign(['layout', 'yaxis', 'range'], yrange);
+            return patch.build();
+        }
+        let figure = {...ori_figure, data: data};
+        figure.layout.yaxis.range = yrange;
+        return figure;
+    }
+
+    // Get a slice from the volume as a list of rows (typed arrays)
+    function get_slice(index) {
+        let [_, h, w] = shape;
+        let rows = [];
+        if (!window._vol) return rows;
+        for (let y = 0; y < h; y++) {
+            rows.push(window._vol.subarray((index * h + y) * w, (index * h + y + 1) * w));
+        }
+        return rows;
+    }
+
     // Get figure
     let figure_result = dash_clientside.no_update;
 
     if (!option || option == 'noop') {
         // noop
-    } else if (option == 'sleep') {
-        while (performance.now() < now + 500) {}
     } else if (option == 'empty') {
-        figure_result = {...ori_figure};
-        figure_result.layout.yaxis.range = [128, 0];
-        figure_result.data = [];
+        figure_result = make_figure([], [128, 0]);
     } else if (option == 'heatmap') {
-        let trace = {type: 'heatmap', z: data_list[index]};
-        figure_result = {...ori_figure};
-        figure_result.layout.yaxis.range = [128, 0];
-        figure_result.data = [trace];
+        let trace = {type: 'heatmap', z: get_slice(index)};
+        figure_result = make_figure([trace], [128, 0]);
     } else if (option == 'heatmapgl') {
-        let trace = {type: 'heatmapgl', z: data_list[index]};
-        figure_result = {...ori_figure};
-        figure_result.layout.yaxis.range = [128, 0];
-        figure_result.data = [trace];
+        let trace = {type: 'heatmapgl', z: get_slice(index)};
+        figure_result = make_figure([trace], [128, 0]);
     } else if (option == 'png') {
-        let trace = {type: 'image', source: data_png[index]};
-        figure_result = {...ori_figure};
-        figure_result.layout.yaxis.range = [128, 0];
-        figure_result.data = [trace];
+        let trace = {type: 'image', source: '/slice/' + index + '.png'};
+        figure_result = make_figure([trace], [128, 0]);
     } else if (option == 'png not reversed') {
-        let trace = {type: 'image', source: data_png[index]};
-        figure_result = {...ori_figure};
-        figure_result.layout.yaxis.range = [0, 128];
-        figure_result.data = [trace];
+        let trace = {type: 'image', source: '/slice/' + index + '.png'};
+        figure_result = make_figure([trace], [0, 128]);
+    } else if (option == 'jpeg') {
+        let trace = {type: 'image', source: '/slice/' + index + '.jpeg'};
+        figure_result = make_figure([trace], [128, 0]);
     } else {
         fps_result = "invalid option: " + option;
     }
@@ -139,8 +198,7 @@ function update_figure(index, option, ori_figure, data_list, data_png) {
     [
         State("dropdown", "value"),
         State("graph", "figure"),
-        State("data_list", "data"),
-        State("data_png", "data"),
+        State("vol_shape", "data"),
     ],
 )
 
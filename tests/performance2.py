@@ -3,13 +3,16 @@ A test application to test the performance of a minimal example that allows
 slicing through a volume using a slider.
 """
 
+import base64
+
+import flask
 import plotly.graph_objects as go
 import dash
 from dash import html
 from dash import dcc
 from dash.dependencies import Input, Output, State
 import imageio
-from dash_slicer.utils import img_array_to_uri
+from dash_slicer.utils import img_array_to_uri, map_in_threads
 
 
 app = dash.Dash(__name__, update_title=None)
@@ -18,7 +21,17 @@ server = app.server
 # Read volumes and create slicer objects
 vol = imageio.volread("imageio:stent.npz")
 
-slices_png = [img_array_to_uri(im) for im in vol]
+slices_png = map_in_threads(img_array_to_uri, vol)  # zlib releases the GIL
+png_bytes = [base64.b64decode(uri.split(",", 1)[1]) for uri in slices_png]
+
+
+# Serve the slices by url, so that they're not all sent to the browser up-front,
+# and the browser can cache them.
+@server.route("/slice/<int:index>.png")
+def serve_slice(index):
+    response = flask.Response(png_bytes[index], mimetype="image/png")
+    response.cache_control.max_age = 3600
+    return response
 
 
 ##
@@ -53,7 +66,6 @@ app.layout = html.Div(
         dcc.Graph(id="graph", figure=fig),
         dcc.Store(id="index", data=0),
         dcc.Store(id="trace", data=None),
-        dcc.Store(id="data_png", data=slices_png),
     ]
 )
 
@@ -73,13 +85,20 @@ function update_index(index) {
 
 app.clientside_callback(
     """
-function update_trace(index, data_png) {
-    return {type: 'image', source: data_png[index]};
+function update_trace(index) {
+    // Coalesce slider events, so the figure updates at most once per frame
+    let id = window._trace_request_id = (window._trace_request_id || 0) + 1;
+    return new Promise(resolve => requestAnimationFrame(() => {
+        if (id !== window._trace_request_id) {
+            resolve(dash_clientside.no_update);
+        } else {
+            resolve({type: 'image', source: '/slice/' + index + '.png'});
+        }
+    }));
 }
 """,
     Output("trace", "data"),
     [Input("index", "data")],
-    [State("data_png", "data")],
 )
 
 
@@ -100,18 +119,26 @@ function update_figure(trace, ori_figure) {
         window.framecount += 1;
     }
 
+    // Only send the changes if this version of Dash supports partial updates
+    function make_figure(data, yrange) {
+        if (dash_clientside.Patch) {
+            let patch = new dash_clientside.Patch();
+            patch.assign(['data'], data).assign(['layout', 'yaxis', 'range'], yrange);
+            return patch.build();
+        }
+        let figure = {...ori_figure, data: data};
+        figure.layout.yaxis.range = yrange;
+        return figure;
+    }
+
     // Get figure
     let figure_result = dash_clientside.no_update;
 
     if (true) {
-        figure_result = {...ori_figure};
-        figure_result.layout.yaxis.range = [128, 0];
-        figure_result.data = [trace];
+        figure_result = make_figure([trace], [128, 0]);
     } else {
         // unfavorable y-axis
-        figure_result = {...ori_figure};
-        figure_result.layout.yaxis.range = [0, 128];
-        figure_result.data = [trace];
+        figure_result = make_figure([trace], [0, 128]);
     }
     return [figure_result, fps_result];
 }
@@ -108,6 +108,20 @@ def test_clim():
         VolumeSlicer(app, vol, clim=(10, 12, 14))
 
 
+def test_slice_info_geometry():
+    app = dash.Dash()
+    vol = np.random.uniform(0, 255, (20, 20, 20)).astype(np.uint8)
+
+    s = VolumeSlicer(app, vol, origin=(10, 20, 30), axis=0)
+    assert s._slice_info["bbox"] == [29.5, 49.5, 19.5, 39.5]
+    assert s._slice_info["indicator_size"] == 2.0
+
+    # The indicators must be smaller than the smallest dimension
+    s = VolumeSlicer(app, vol, spacing=(0.125, 1, 1), axis=1)
+    assert s._slice_info["bbox"] == [-0.5, 19.5, -0.0625, 2.4375]
+    assert s._slice_info["indicator_size"] == 0.45 * 2.5
+
+
 def test_scene_id_and_context_id():
     app = dash.Dash()
 
@@ -143,6 +157,42 @@ def test_slice():
     assert im.dtype == np.uint8
     assert im.shape == (10, 20)
 
+    # Uint8 data with full-range clim is used as-is
+    im = s._slice(1, (0, 255))
+    assert im.dtype == np.uint8
+    assert np.all(im == vol[:, :, 1])
+
+    # Uint8 data gives the same result as other data
+    im1 = s._slice(1, (20, 100))
+    s = VolumeSlicer(app, vol.astype(np.float32), axis=2)
+    im2 = s._slice(1, (20, 100))
+    assert im1.dtype == im2.dtype == np.uint8
+    assert np.all(im1 == im2)
+
+    # Slices can be downscaled before applying the clim
+    im = s._slice(1, (20, 100), 5)
+    assert im.dtype == np.uint8
+    assert im.shape == (5, 10)
+
+
+def test_slice_memmap(tmp_path):
+    app = dash.Dash()
+    vol = np.random.uniform(0, 255, (10, 20, 30)).astype(np.uint8)
+    filename = str(tmp_path / "vol.npy")
+    np.save(filename, vol)
+    vol_mm = np.load(filename, mmap_mode="r")
+
+    for axis in (0, 1, 2):
+        s1 = VolumeSlicer(app, vol, axis=axis, clim=(0, 100))
+        s2 = VolumeSlicer(app, vol_mm, axis=axis, clim=(0, 100))
+        assert np.all(s1._slice(1, (0, 100)) == s2._slice(1, (0, 100)))
+
+    # In-memory volumes are copied for axis 2, so slices are contiguous
+    assert VolumeSlicer(app, vol, axis=2)._slices.flags.c_contiguous
+    assert not np.shares_memory(VolumeSlicer(app, vol, axis=2)._slices, vol)
+    assert np.shares_memory(VolumeSlicer(app, vol, axis=1)._slices, vol)
+    assert np.shares_memory(VolumeSlicer(app, vol_mm, axis=2)._slices, vol_mm)
+
 
 def test_create_overlay_data():
 
@@ -1,21 +1,38 @@
 from dash_slicer.utils import (
+    _UriCache,
+    _thumbnail_size_from_scalar,
     img_as_ubyte,
     img_array_to_uri,
+    img_array_to_raw,
+    img_array_to_thumbnail,
     get_thumbnail_size,
     shape3d_to_size2d,
+    colormap_to_palette,
     mask_to_coloured_slices,
+    map_in_threads,
 )
 
+import io
+import base64
+
 import numpy as np
+import PIL.Image
 from pytest import raises
 
 
+def uri_to_array(uri):
+    """Decode a base64-encoded PNG (as produced by img_array_to_uri)."""
+    png = base64.b64decode(uri.split(",", 1)[1])
+    return np.asarray(PIL.Image.open(io.BytesIO(png)).convert("RGBA"))
+
+
 def test_img_as_ubyte():
 
     im = np.zeros((100, 100), np.float32)
     im[0, 0] = 100
 
-    # Anything but uint8 is stretched to min-max
+    # Anything but uint8 is stretched between the 2nd and 98th percentile,
+    # or min-max if these are equal, as in this mostly-zero image
     im2 = img_as_ubyte(im)
     assert im2.dtype == np.uint8
     assert im2.min() == 0 and im2.max() == 255
@@ -26,6 +43,26 @@ def test_img_as_ubyte():
     assert im3.dtype == np.uint8
     assert im3.min() == 0 and im3.max() == 100
 
+    # Bool images are stretched too
+    im2 = img_as_ubyte(np.array([[True, False]]))
+    assert im2.dtype == np.uint8 and im2.tolist() == [[255, 0]]
+    mask = np.zeros((100, 100), bool)
+    mask[0, 0] = True
+    assert img_as_ubyte(mask).max() == 255
+    assert img_array_to_uri(mask).startswith("data:image/png;base64,")
+
+    # Hot pixels don't make the rest of the image dark
+    im = np.tile(np.linspace(0, 1, 100, dtype=np.float32), (100, 1))
+    im[10, 10] = im[20, 20] = 1000
+    im2 = img_as_ubyte(im)
+    assert 100 < np.median(im2) < 155
+    assert im2.min() == 0 and im2[10, 10] == im2[20, 20] == 255
+
+    # A constant image does not divide by zero
+    with np.errstate(all="raise"):
+        im4 = img_as_ubyte(np.full((10, 10), 3.0))
+    assert im4.dtype == np.uint8 and np.all(im4 == 0)
+
 
 def test_img_array_to_uri():
 
@@ -41,6 +78,73 @@ def test_img_array_to_uri():
 
     assert len(r1) > len(r2) > len(r3)
 
+    # The PNG decodes to the original pixels, for any number of channels
+    im3 = np.random.uniform(0, 255, (20, 30, 4)).astype(np.uint8)
+    assert np.all(uri_to_array(img_array_to_uri(im))[:, :, 0] == im)
+    assert np.all(uri_to_array(img_array_to_uri(im3)) == im3)
+    assert np.all(
+        uri_to_array(img_array_to_uri(im3[:, :, :3]))[:, :, :3] == im3[:, :, :3]
+    )
+    im2 = uri_to_array(img_array_to_uri(im3[:, ::2, :2]))
+    assert np.all(im2[:, :, 0] == im3[:, ::2, 0]) and np.all(
+        im2[:, :, 3] == im3[:, ::2, 1]
+    )
+
+    # Results are cached by content
+    assert img_array_to_uri(im.copy()) == r1
+    assert img_array_to_uri(im.astype(np.float32)) != r1
+    im[0, 0] += 1
+    assert img_array_to_uri(im) != r1
+
+    # Higher compression levels give smaller PNGs with the same pixels
+    ramp = np.tile(np.arange(100, dtype=np.uint8), (100, 1)) // 4
+    r6 = img_array_to_uri(ramp, compress_level=9)
+    assert len(r6) < len(img_array_to_uri(ramp, compress_level=0))
+    assert np.all(uri_to_array(r6)[:, :, 0] == ramp)
+
+    # Jpeg
+    r4 = img_array_to_uri(im, fmt="jpeg")
+    assert r4.startswith("data:image/jpeg;base64,")
+    r5 = img_array_to_uri(np.stack([im, im, im], 2), 32, fmt="jpeg")
+    assert r5.startswith("data:image/jpeg;base64,")
+
+    # Wrong
+    with raises(ValueError):
+        img_array_to_uri(im, fmt="gif")
+    with raises(ValueError):
+        img_array_to_uri(im, compress_level=10)
+    with raises(ValueError):
+        img_array_to_uri(np.zeros((10, 10, 4), np.uint8), fmt="jpeg")  # no alpha
+    with raises(ValueError):
+        img_array_to_uri(np.zeros((10, 10, 3), np.uint8), palette=np.zeros((256, 4)))
+
+
+def test_img_array_to_raw():
+
+    im = np.random.uniform(0, 255, (20, 30)).astype(np.uint8)
+
+    r = img_array_to_raw(im)
+    assert isinstance(r, str)
+    im2 = np.frombuffer(base64.b64decode(r), np.uint8).reshape(20, 30)
+    assert np.all(im == im2)
+
+    # Non-contiguous arrays are sent in C-order
+    r = img_array_to_raw(im.T)
+    im2 = np.frombuffer(base64.b64decode(r), np.uint8).reshape(30, 20)
+    assert np.all(im.T == im2)
+
+
+def test_img_array_to_thumbnail():
+
+    im = np.random.uniform(0, 255, (100, 50)).astype(np.uint8)
+    assert img_array_to_thumbnail(im, 100) is im
+    th = img_array_to_thumbnail(im, 10)
+    assert th.dtype == np.uint8 and th.shape == (20, 10)
+
+    # Non-uint8 data is downscaled as float, and normalized afterwards
+    th = img_array_to_thumbnail(im.astype(np.int16), 10)
+    assert th.dtype == np.float32 and th.shape == (20, 10)
+
 
 def test_get_thumbnail_size():
 
@@ -48,6 +152,18 @@ def test_get_thumbnail_size():
     assert get_thumbnail_size((50, 100), 16) == (16, 32)
     assert get_thumbnail_size((100, 100), 8) == (8, 8)
     assert get_thumbnail_size((100, 50), 8) == (16, 8)
+    assert get_thumbnail_size((10, 20), 32) == (10, 20)  # no upscaling
+
+    # Should match what Pillow's thumbnail() produces
+    for size in [(100, 100), (512, 300), (300, 512), (37, 91), (640, 7)]:
+        for ref_size in [1, 8, 16, 32, 33]:
+            img_pil = PIL.Image.new("L", size)
+            img_pil.thumbnail(_thumbnail_size_from_scalar(size, ref_size))
+            assert get_thumbnail_size(size, ref_size) == img_pil.size
+
+    # And img_array_to_uri() should produce that size
+    im = np.zeros((91, 37), np.uint8)
+    assert uri_to_array(img_array_to_uri(im, 16)).shape[:2] == (39, 16)
 
 
 def test_shape3d_to_size2d():
@@ -61,6 +177,32 @@ def test_shape3d_to_size2d():
         shape3d_to_size2d((12, 13, 14), 3)
 
 
+def test_colormap_to_palette():
+
+    palette = colormap_to_palette(["#ff0000", (0, 255, 0, 50)])
+    assert palette.shape == (256, 4) and palette.dtype == np.uint8
+    assert palette[:3].tolist() == [[0, 0, 0, 0], [255, 0, 0, 100], [0, 255, 0, 50]]
+    assert np.all(palette[3:] == (0, 255, 0, 50))
+
+    # Cached, also for (unhashable) lists
+    assert np.all(colormap_to_palette([[255, 0, 0], (0, 255, 0, 50)]) == palette)
+    assert colormap_to_palette(["#ff0000", [0, 255, 0, 50]]) is palette
+    assert colormap_to_palette() is colormap_to_palette(None)
+    colormap = np.array([[255, 0, 0, 100], [0, 255, 0, 50]], np.uint8)
+    assert np.all(colormap_to_palette(colormap) == palette)
+    assert colormap_to_palette(colormap[0, :3]).tolist()[1] == [255, 0, 0, 100]
+    assert colormap_to_palette(["#f00", "#0f03"]).tolist()[1:3] == [
+        [255, 0, 0, 100],
+        [0, 255, 0, 51],
+    ]
+    assert colormap_to_palette("#ff000080").tolist()[1] == [255, 0, 0, 128]
+    for color in ["red", "#ff0000f", "#ff00zz", (255, 0)]:
+        with raises(ValueError):
+            colormap_to_palette(color)
+    with raises(ValueError):
+        palette[0, 0] = 1  # read-only
+
+
 def test_mask_to_coloured_slices():
     vol = np.random.uniform(0, 255, (10, 20, 30)).astype(np.uint8)
     mask = vol > 20
@@ -92,6 +234,30 @@ def test_mask_to_coloured_slices():
     overlay = mask_to_coloured_slices(vol.astype(np.uint8), 0, ["#ff0000", "#00ff00"])
     assert all(isinstance(x, str) for x in overlay)
 
+    # The colors end up in the image as-is
+    overlay = mask_to_coloured_slices(mask, 0, [(31, 119, 180), (0, 255, 0)])
+    rgba = uri_to_array(overlay[0])
+    assert rgba.shape == (20, 30, 4)
+    assert np.all(rgba[mask[0]] == (31, 119, 180, 100))
+    assert np.all(rgba[~mask[0]] == (0, 0, 0, 0))
+
+    # Mask values index the colormap, using the last color beyond it
+    labels = np.array([[[0, 1, 2, 3]]], np.uint8)
+    overlay = mask_to_coloured_slices(labels, 0, ["#ff0000", (0, 255, 0, 50)])
+    rgba = uri_to_array(overlay[0])
+    assert rgba[0].tolist() == [
+        [0, 0, 0, 0],
+        [255, 0, 0, 100],
+        [0, 255, 0, 50],
+        [0, 255, 0, 50],
+    ]
+
+    # The overlay is no larger than the rgba image of the same slice
+    overlay = mask_to_coloured_slices(mask, 0, [(31, 119, 180), (0, 255, 0)])
+    for i in range(len(mask)):
+        rgba_uri = img_array_to_uri(uri_to_array(overlay[i]))
+        assert len(overlay[i]) <= len(rgba_uri)
+
     # Reset by zero mask
     overlay = mask_to_coloured_slices(vol > 300, 0)
     assert all(x is None for x in overlay)
@@ -99,6 +265,8 @@ def test_mask_to_coloured_slices():
     # Wrong
     with raises(ValueError):
         mask_to_coloured_slices(mask, 0, "red")  # named colors not supported yet
+    with raises(ValueError):
+        mask_to_coloured_slices(mask, 0, "#ff00zz")  # not a hex color
     with raises(ValueError):
         mask_to_coloured_slices(mask, 0, [0, 255, 0, 100, 100])  # not a color
     with raises(ValueError):
@@ -111,3 +279,27 @@ def test_mask_to_coloured_slices():
         )  # note that the mask in create_overlay_data can be None
     with raises(ValueError):
         mask_to_coloured_slices(vol.astype(np.float32), 0)  # wrong dtype
+
+
+def test_map_in_threads():
+
+    assert map_in_threads(str, []) == []
+    assert map_in_threads(str, [3]) == ["3"]
+    assert map_in_threads(str, range(100)) == [str(i) for i in range(100)]
+
+    # Nested use does not deadlock the shared pool
+    nested = map_in_threads(lambda i: map_in_threads(str, range(i)), range(20))
+    assert nested == [[str(j) for j in range(i)] for i in range(20)]
+
+
+def test_uri_cache():
+
+    cache = _UriCache(10)
+    cache.set(1, "aaaa")
+    cache.set(2, "bbbb")
+    assert cache.get(1) == "aaaa"  # now 2 is the least recently used
+    cache.set(3, "cccc")
+    assert cache.get(2) is None
+    assert cache.get(1) == "aaaa" and cache.get(3) == "cccc"
+    cache.clear()
+    assert cache.get(1) is None
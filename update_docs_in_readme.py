@@ -15,18 +15,17 @@ def write_reference_docs():
     # Prepare
     filename = os.path.join(HERE, "README.md")
     assert os.path.isfile(filename), "README.md not found"
-    # Load first part of the readme
+    # Load first part of the readme, as bytes, so we don't decode it
     with open(filename, "rb") as f:
-        text = f.read().decode()
-    text1, _, _ = text.partition(md_seperator)
+        text1, _, _ = f.read().partition(md_seperator.encode())
     text1 = text1.strip()
     # Create second part of the readme
     text2 = "\n\n" + md_seperator + "\n\n" + get_reference_docs()
-    if "\r" in text1:
+    if b"\r" in text1:
         text2 = text2.replace("\n", "\r\n")
     # Wite
     with open(filename, "wb") as f:
-        f.write(text1.encode())
+        f.write(text1)
         f.write(text2.encode())
     print("Updated the reference docs in README.md")
 